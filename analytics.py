@@ -0,0 +1,285 @@
+"""
+Expense analytics for Mantra WebLogix TCS
+Daily and per-member rollups maintained on write, plus ad-hoc groupings
+"""
+
+from flask import Blueprint, request, jsonify, session
+from datetime import datetime, timedelta
+
+from models import db, Trip, Expense, DailyRollup, MemberDailyRollup
+from ratelimit import concurrency_limited
+
+analytics_bp = Blueprint('analytics', __name__, url_prefix='/tcs/analytics')
+
+# Longest date range accepted by the ad-hoc (raw expense) endpoint
+MAX_ADHOC_DAYS = 366
+
+ADHOC_GROUPS = ('day', 'month', 'weekday', 'member', 'trip')
+
+# Rollup amounts closer to zero than this count as empty (float drift)
+ZERO_AMOUNT = 0.005
+
+WEEKDAYS = ('Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday')
+
+
+# ==================== ROLLUP MAINTENANCE ====================
+
+def _effective_split(expense, members):
+    """Members an expense is split among (empty split means everyone)"""
+    return expense.split_among or members or []
+
+
+def _insert(table):
+    """Dialect-specific INSERT supporting upserts"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def _increment(model, keys, deltas):
+    """Atomically add deltas to a rollup row, creating it if missing.
+
+    One INSERT ... ON CONFLICT DO UPDATE statement, so concurrent writers
+    neither race on the insert nor lose increments.
+    """
+    table = model.__table__
+    stmt = _insert(table).values(**keys, **deltas)
+    if hasattr(stmt, 'on_duplicate_key_update'):
+        stmt = stmt.on_duplicate_key_update(
+            {column: table.c[column] + stmt.inserted[column] for column in deltas})
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: table.c[column] + stmt.excluded[column] for column in deltas})
+    db.session.execute(stmt)
+
+
+def apply_expense_rollup(expense, members, sign=1):
+    """Add (sign=1) or remove (sign=-1) one expense from the rollup tables"""
+    day = expense.date.date()
+    amount = expense.amount * sign
+
+    _increment(DailyRollup, {'trip_id': expense.trip_id, 'day': day},
+               {'total_amount': amount, 'expenses_count': sign})
+
+    split_among = _effective_split(expense, members)
+    split_amount = amount / len(split_among) if split_among else 0
+    deltas = {expense.paid_by: [amount, 0.0, sign]}
+    for person in split_among:
+        deltas.setdefault(person, [0.0, 0.0, 0])[1] += split_amount
+
+    for person, (paid, share, count) in deltas.items():
+        _increment(MemberDailyRollup, {'trip_id': expense.trip_id, 'member': person, 'day': day},
+                   {'paid': paid, 'share': share, 'expenses_count': count})
+
+    if sign < 0:
+        # Drop rows the removal emptied so queries don't return 0.0 entries
+        DailyRollup.query.filter(
+            DailyRollup.trip_id == expense.trip_id, DailyRollup.day == day,
+            DailyRollup.expenses_count <= 0
+        ).delete(synchronize_session=False)
+        MemberDailyRollup.query.filter(
+            MemberDailyRollup.trip_id == expense.trip_id, MemberDailyRollup.day == day,
+            MemberDailyRollup.member.in_(list(deltas)),
+            MemberDailyRollup.expenses_count <= 0,
+            db.func.abs(MemberDailyRollup.paid) < ZERO_AMOUNT,
+            db.func.abs(MemberDailyRollup.share) < ZERO_AMOUNT
+        ).delete(synchronize_session=False)
+
+
+def clear_trip_rollups(trip_id):
+    """Delete all rollup rows for a trip"""
+    DailyRollup.query.filter_by(trip_id=trip_id).delete()
+    MemberDailyRollup.query.filter_by(trip_id=trip_id).delete()
+
+
+def refresh_trip_rollups(trip):
+    """Recompute the rollups of one trip (used when its members change)"""
+    clear_trip_rollups(trip.id)
+    for expense in trip.expenses:
+        apply_expense_rollup(expense, trip.members)
+
+
+def rebuild_rollups():
+    """Rebuild both rollup tables from all trips and expenses"""
+    DailyRollup.query.delete()
+    MemberDailyRollup.query.delete()
+    count = 0
+    for trip in Trip.query.all():
+        for expense in trip.expenses:
+            apply_expense_rollup(expense, trip.members)
+            count += 1
+    db.session.commit()
+    return count
+
+
+# ==================== HELPER FUNCTIONS ====================
+
+def parse_day(value):
+    """Parse a YYYY-MM-DD query argument (None when missing)"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def visible_trip_ids():
+    """Trip ids this session may query (None means all trips, for admins)"""
+    if session.get('admin_authenticated'):
+        return None
+    return session.get('authorized_trips', [])
+
+
+def scoped(query, trip_column):
+    """Restrict a query to the trips visible in this session"""
+    trip_ids = visible_trip_ids()
+    if trip_ids is not None:
+        query = query.filter(trip_column.in_(trip_ids))
+    trip_id = request.args.get('trip_id')
+    if trip_id:
+        query = query.filter(trip_column == trip_id)
+    return query
+
+
+def _date_key(column, group_by):
+    """SQL expression grouping a datetime column by day, month or weekday.
+
+    Day and month are 'YYYY-MM-DD' / 'YYYY-MM' strings; weekday is 0-6
+    with Sunday as 0, as in WEEKDAYS.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        if group_by == 'weekday':
+            return db.cast(db.extract('dow', column), db.Integer)
+        return db.func.to_char(column, 'YYYY-MM-DD' if group_by == 'day' else 'YYYY-MM')
+    if dialect in ('mysql', 'mariadb'):
+        if group_by == 'weekday':
+            return db.func.dayofweek(column) - 1
+        return db.func.date_format(column, '%Y-%m-%d' if group_by == 'day' else '%Y-%m')
+    return db.func.strftime({'day': '%Y-%m-%d', 'month': '%Y-%m', 'weekday': '%w'}[group_by], column)
+
+
+# ==================== ANALYTICS ROUTES ====================
+
+@analytics_bp.route('/daily')
+def daily_totals():
+    """Spending per day, optionally for one member (paid and share)"""
+    try:
+        start = parse_day(request.args.get('start'))
+        end = parse_day(request.args.get('end'))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Dates must be YYYY-MM-DD'}), 400
+
+    member = request.args.get('member')
+    if member:
+        query = db.session.query(
+            MemberDailyRollup.day,
+            db.func.sum(MemberDailyRollup.paid),
+            db.func.sum(MemberDailyRollup.share),
+            db.func.sum(MemberDailyRollup.expenses_count)
+        ).filter(MemberDailyRollup.member == member)
+        query = scoped(query, MemberDailyRollup.trip_id)
+        day_column = MemberDailyRollup.day
+    else:
+        query = db.session.query(
+            DailyRollup.day,
+            db.func.sum(DailyRollup.total_amount),
+            db.func.sum(DailyRollup.total_amount),
+            db.func.sum(DailyRollup.expenses_count)
+        )
+        query = scoped(query, DailyRollup.trip_id)
+        day_column = DailyRollup.day
+
+    if start:
+        query = query.filter(day_column >= start)
+    if end:
+        query = query.filter(day_column <= end)
+
+    days = [{
+        'day': day.isoformat(),
+        'paid': round(paid or 0.0, 2),
+        'share': round(share or 0.0, 2),
+        'expenses_count': int(count or 0)
+    } for day, paid, share, count in query.group_by(day_column).order_by(day_column)]
+
+    return jsonify({'status': 'success', 'member': member, 'days': days})
+
+
+@analytics_bp.route('/members')
+def member_totals():
+    """Amount paid and share owed per member over a date range"""
+    try:
+        start = parse_day(request.args.get('start'))
+        end = parse_day(request.args.get('end'))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Dates must be YYYY-MM-DD'}), 400
+
+    query = db.session.query(
+        MemberDailyRollup.member,
+        db.func.sum(MemberDailyRollup.paid),
+        db.func.sum(MemberDailyRollup.share),
+        db.func.sum(MemberDailyRollup.expenses_count)
+    )
+    query = scoped(query, MemberDailyRollup.trip_id)
+    if start:
+        query = query.filter(MemberDailyRollup.day >= start)
+    if end:
+        query = query.filter(MemberDailyRollup.day <= end)
+
+    members = [{
+        'member': member,
+        'paid': round(paid or 0.0, 2),
+        'share': round(share or 0.0, 2),
+        'balance': round((paid or 0.0) - (share or 0.0), 2),
+        'expenses_count': int(count or 0)
+    } for member, paid, share, count in query.group_by(MemberDailyRollup.member).order_by(MemberDailyRollup.member)]
+
+    return jsonify({'status': 'success', 'members': members})
+
+
+@analytics_bp.route('/expenses')
+@concurrency_limited(2)
+def adhoc_totals():
+    """Ad-hoc grouping of raw expenses over a bounded date range (grouped in SQL)"""
+    group_by = request.args.get('group_by', 'day')
+    if group_by not in ADHOC_GROUPS:
+        return jsonify({'status': 'error', 'message': f"group_by must be one of {', '.join(ADHOC_GROUPS)}"}), 400
+    try:
+        start = parse_day(request.args.get('start'))
+        end = parse_day(request.args.get('end'))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Dates must be YYYY-MM-DD'}), 400
+    if not start or not end:
+        return jsonify({'status': 'error', 'message': 'start and end are required'}), 400
+    if end < start or (end - start).days >= MAX_ADHOC_DAYS:
+        return jsonify({'status': 'error', 'message': f'Date range must be 1 to {MAX_ADHOC_DAYS} days'}), 400
+
+    if group_by == 'member':
+        key = Expense.paid_by
+    elif group_by == 'trip':
+        key = Expense.trip_id
+    else:
+        key = _date_key(Expense.date, group_by)
+
+    # Range scan on the (trip_id, date), (paid_by, date) or date index
+    query = db.session.query(key, db.func.sum(Expense.amount), db.func.count(Expense.id)).filter(
+        Expense.date >= datetime.combine(start, datetime.min.time()),
+        Expense.date < datetime.combine(end + timedelta(days=1), datetime.min.time())
+    )
+    query = scoped(query, Expense.trip_id)
+    member = request.args.get('member')
+    if member:
+        query = query.filter(Expense.paid_by == member)
+
+    groups = [{
+        'key': WEEKDAYS[int(value)] if group_by == 'weekday' else value,
+        'total_amount': round(total or 0.0, 2),
+        'expenses_count': int(count)
+    } for value, total, count in query.group_by(key)]
+    groups.sort(key=lambda group: group['key'])
+
+    return jsonify({'status': 'success', 'group_by': group_by, 'groups': groups})
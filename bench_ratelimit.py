@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Rate limiting load test for Mantra WebLogix
+Abusive clients flood add-member on one trip (every call is a real write
+that takes the database write lock) while well-behaved clients add members
+to their own trip at a polite pace. Reports the well-behaved writes'
+latency with the limiter off and on.
+"""
+
+import http.cookiejar
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from werkzeug.serving import make_server
+
+ABUSERS = 8
+# Requests per second each abuser offers (open loop: it does not wait for
+# throttled responses to slow it down, nor speed up when they are cheap)
+ABUSER_RATE = 40
+WELL_BEHAVED = 8
+DURATION_SECONDS = 10
+# Below the session limit on mutations (2/s), so only abuse gets throttled
+WELL_BEHAVED_INTERVAL = 0.6
+
+
+class Client:
+    """HTTP client with its own cookie jar (one TCS session) and client IP"""
+
+    def __init__(self, base_url, ip):
+        self.base_url = base_url
+        self.ip = ip
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        # The app runs behind ProxyFix here, so each client has its own IP bucket
+        req = urllib.request.Request(self.base_url + path, data=data, headers={
+            'Content-Type': 'application/json', 'X-Forwarded-For': self.ip})
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+def serve(app):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_scenario(rate_limit_enabled, db_path):
+    from app import create_app, init_schema
+
+    os.environ['PROXY_COUNT'] = '1'
+    app = create_app({'RATELIMIT_ENABLED': rate_limit_enabled,
+                      'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    init_schema(app)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = serve(app)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    victim = Client(base_url, '10.0.0.1')
+    _, body = victim.request('/tcs/trip/new', {'name': 'Target', 'members': ['a', 'b']})
+    target_id = json.loads(body)['trip_id']
+    time.sleep(1.1)  # trip ids have one-second resolution
+    _, body = victim.request('/tcs/trip/new', {'name': 'Quiet', 'members': ['x', 'y']})
+    quiet_id = json.loads(body)['trip_id']
+
+    stop = threading.Event()
+    statuses = {}
+    latencies = []
+    lock = threading.Lock()
+
+    def abuse(n):
+        client = Client(base_url, f'10.0.1.{n}')
+        client.request(f'/tcs/trip/{target_id}/enter', {'entered_id': target_id})
+        i = 0
+        next_at = time.monotonic()
+        while not stop.is_set():
+            i += 1
+            # Unique names, so every accepted call writes the trip and its summary
+            status, _ = client.request(f'/tcs/trip/{target_id}/add-member', {'name': f'spam-{n}-{i}'})
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+            next_at += 1 / ABUSER_RATE
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+    def behave(n):
+        client = Client(base_url, f'10.0.2.{n}')
+        client.request(f'/tcs/trip/{quiet_id}/enter', {'entered_id': quiet_id})
+        i = 0
+        while not stop.is_set():
+            i += 1
+            start = time.perf_counter()
+            status, _ = client.request(f'/tcs/trip/{quiet_id}/add-member', {'name': f'guest-{n}-{i}'})
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append((elapsed, status))
+            time.sleep(WELL_BEHAVED_INTERVAL)
+
+    threads = ([threading.Thread(target=abuse, args=(n,)) for n in range(ABUSERS)] +
+               [threading.Thread(target=behave, args=(n,)) for n in range(WELL_BEHAVED)])
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION_SECONDS)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    times = sorted(elapsed for elapsed, _ in latencies)
+    return {
+        'p50': statistics.median(times),
+        'p99': times[int(len(times) * 0.99) - 1],
+        'max': times[-1],
+        'failed': sum(1 for _, status in latencies if status != 200),
+        'requests': len(latencies),
+        'abuser_statuses': dict(sorted(statuses.items())),
+    }
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        for enabled in (False, True):
+            result = run_scenario(enabled, os.path.join(tmp, f'bench_{int(enabled)}.db'))
+            label = 'limiter on ' if enabled else 'limiter off'
+            print(f"{label}: well-behaved writes p50 {result['p50']:6.1f} ms  p99 {result['p99']:6.1f} ms  "
+                  f"max {result['max']:6.1f} ms  failed {result['failed']}/{result['requests']}  "
+                  f"abuser responses {result['abuser_statuses']}")
+    sys.exit(0)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Startup benchmark for Mantra WebLogix
+Measures import time of the app module (python -X importtime) and the
+time from a cold interpreter to create_app() serving its first request.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Budgets in milliseconds; the script exits non-zero when one is exceeded.
+# Importing Flask and SQLAlchemy alone costs ~300 ms (as reported by
+# -X importtime, which inflates it) on a dev laptop. The budgets are
+# product targets: a worker must be ready in well under a second. They are
+# not fitted to the current figures.
+IMPORT_BUDGET_MS = 750
+FIRST_REQUEST_BUDGET_MS = 1000
+
+# Modules that `import app` must not load; they belong to create_app()
+DEFERRED_MODULES = ('tcs', 'analytics')
+
+DEFERRED_SNIPPET = f"""
+import sys
+import app
+print(' '.join(name for name in {DEFERRED_MODULES!r} if name in sys.modules))
+"""
+
+FIRST_REQUEST_SNIPPET = """
+import time
+start = time.perf_counter()
+from app import create_app
+app = create_app({'TESTING': True})
+# /tcs renders without touching the database, so no schema step is timed
+response = app.test_client().get('/tcs')
+assert response.status_code == 200, response.status_code
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def _env(db_path):
+    env = dict(os.environ)
+    env['DATABASE_URL'] = f'sqlite:///{db_path}'
+    return env
+
+
+def measure_import(env):
+    """Cumulative import time of the app module, in milliseconds"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        capture_output=True, text=True, env=env, check=True
+    )
+    # Last line is the top-level module: "import time: self | cumulative | app"
+    for line in reversed(result.stderr.splitlines()):
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == 'app':
+            return int(parts[1]) / 1000
+    raise RuntimeError('app module not found in -X importtime output')
+
+
+def eager_imports(env):
+    """Deferred modules that `import app` loaded anyway"""
+    result = subprocess.run(
+        [sys.executable, '-c', DEFERRED_SNIPPET],
+        capture_output=True, text=True, env=env, check=True
+    )
+    return result.stdout.split()
+
+
+def measure_first_request(env):
+    """Time to create the app and serve the first response, in milliseconds"""
+    result = subprocess.run(
+        [sys.executable, '-c', FIRST_REQUEST_SNIPPET],
+        capture_output=True, text=True, env=env, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def run(runs=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = _env(os.path.join(tmp, 'bench.db'))
+        import_ms = statistics.median(measure_import(env) for _ in range(runs))
+        first_request_ms = statistics.median(measure_first_request(env) for _ in range(runs))
+        eager = eager_imports(env)
+
+    print(f"Import app:         {import_ms:8.1f} ms  (budget {IMPORT_BUDGET_MS} ms)")
+    print(f"Time to 1st request: {first_request_ms:7.1f} ms  (budget {FIRST_REQUEST_BUDGET_MS} ms)")
+
+    if eager:
+        print(f"Loaded by import app: {', '.join(eager)} (should wait for create_app)")
+
+    ok = import_ms <= IMPORT_BUDGET_MS and first_request_ms <= FIRST_REQUEST_BUDGET_MS and not eager
+    print("✅ Within budget" if ok else "❌ Over budget")
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run() else 1)
@@ -0,0 +1,325 @@
+"""
+Live trip updates for Mantra WebLogix TCS
+Per-trip Server-Sent Events fed by an in-process broker, optionally
+relayed between workers through a local SQLite event log.
+"""
+
+from flask import Response
+from collections import deque
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Comment line sent to idle streams so proxies keep the connection open
+HEARTBEAT_SECONDS = 15
+
+# Messages buffered per subscriber before it is told to resync
+SUBSCRIBER_BUFFER = 100
+
+# Events are kept this long for replay to reconnecting clients (Last-Event-ID)
+EVENT_RETENTION_SECONDS = 60
+
+# How long a publish waits for another worker's lock on the SQLite log
+LOCK_TIMEOUT_SECONDS = 0.2
+
+RESYNC_MESSAGE = 'event: resync\ndata: {}\n\n'
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event_type, data):
+    """Serialize one SSE event body (done once per publish, not per subscriber)"""
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def frame(event_id, body):
+    """Full SSE frame: the event id line followed by the serialized body"""
+    return f'id: {event_id}\n{body}'
+
+
+# ==================== CROSS-WORKER RELAY ====================
+
+class SQLiteRelay:
+    """Relays events between workers on one host through a SQLite log.
+
+    Each worker writes the events it publishes and runs a single poller
+    thread that delivers other workers' events to its local subscribers.
+    Row ids double as SSE event ids, so they mean the same in every worker.
+    Each process uses one connection, serialized by a lock (a thread-local
+    one would be per greenlet, and reopened per request, under gevent).
+    """
+
+    def __init__(self, path, poll_interval):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._conn = None
+        self._conn_pid = None
+        self._lock = threading.Lock()
+        self._poller_pid = None
+        self._poller_lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self):
+        # Caller holds self._lock. Opened lazily, and again after a fork, so
+        # it is never shared by workers
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT_SECONDS, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'trip_id TEXT NOT NULL, origin INTEGER NOT NULL, '
+                         'message TEXT NOT NULL, created REAL NOT NULL)')
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _reset_connection(self):
+        with self._lock:
+            conn, self._conn = self._conn, None
+            if conn is not None and self._conn_pid == os.getpid():
+                conn.close()
+
+    def write(self, trip_id, body):
+        """Append an event to the log and return its id"""
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            event_id = conn.execute('INSERT INTO events (trip_id, origin, message, created) VALUES (?, ?, ?, ?)',
+                                    (trip_id, os.getpid(), body, now)).lastrowid
+            self._writes += 1
+            if self._writes % 100 == 0:
+                conn.execute('DELETE FROM events WHERE created < ?', (now - EVENT_RETENTION_SECONDS,))
+        return event_id
+
+    def since(self, trip_id, last_id):
+        """Frames for a trip after ``last_id``, or None if some were pruned"""
+        with self._lock:
+            conn = self._connection()
+            oldest = conn.execute('SELECT MIN(id) FROM events').fetchone()[0]
+            if oldest is None:
+                newest = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+                return [] if newest is None or last_id >= newest[0] else None
+            if last_id < oldest - 1:
+                return None
+            rows = conn.execute('SELECT id, message FROM events WHERE trip_id = ? AND id > ? ORDER BY id',
+                                (trip_id, last_id)).fetchall()
+        return [(str(event_id), frame(event_id, body)) for event_id, body in rows]
+
+    def ensure_poller(self, broker):
+        """Start this process's poller thread (again after a fork)"""
+        with self._poller_lock:
+            if self._poller_pid == os.getpid():
+                return
+            self._poller_pid = os.getpid()
+            thread = threading.Thread(target=self._poll, args=(broker,), daemon=True)
+            thread.start()
+
+    def _poll(self, broker):
+        pid = os.getpid()
+        last_id = None
+        while True:
+            try:
+                if last_id is None or not broker.has_subscribers():
+                    # Nobody to deliver to: skip ahead so a later subscriber
+                    # does not receive a backlog of stale events
+                    with self._lock:
+                        last_id = self._connection().execute(
+                            'SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+                else:
+                    with self._lock:
+                        rows = self._connection().execute(
+                            'SELECT id, trip_id, origin, message FROM events '
+                            'WHERE id > ? ORDER BY id', (last_id,)).fetchall()
+                    for event_id, trip_id, origin, body in rows:
+                        last_id = event_id
+                        if origin != pid:
+                            broker.deliver(trip_id, str(event_id), frame(event_id, body))
+            except Exception:
+                # Keep relaying: log, reopen the connection and try again
+                logger.exception('Event relay poll failed')
+                self._reset_connection()
+            time.sleep(self.poll_interval)
+
+
+# ==================== BROKER ====================
+
+class Broker:
+    """Flask extension fanning trip events out to SSE subscribers"""
+
+    def __init__(self, app=None):
+        self.relay = None
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        # Memory backend only: recent frames per trip for Last-Event-ID replay
+        # (a None frame marks an event that was not published: see skip())
+        self._recent = {}
+        self._pruned_up_to = 0
+        self._counter = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENTS_BACKEND', 'memory')
+        app.config.setdefault('EVENTS_SQLITE_PATH', 'events.db')
+        app.config.setdefault('EVENTS_POLL_INTERVAL', 0.5)
+
+        if app.config['EVENTS_BACKEND'] == 'sqlite':
+            self.relay = SQLiteRelay(app.config['EVENTS_SQLITE_PATH'], app.config['EVENTS_POLL_INTERVAL'])
+        else:
+            self.relay = None
+        app.extensions['events'] = self
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def is_listening(self, trip_id):
+        """Whether an event for this trip could reach anyone"""
+        return self.relay is not None or trip_id in self._subscribers
+
+    def subscribe(self, trip_id):
+        """Register a subscriber queue for a trip"""
+        if self.relay is not None:
+            self.relay.ensure_poller(self)
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+        with self._lock:
+            self._subscribers.setdefault(trip_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, trip_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(trip_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[trip_id]
+
+    def publish(self, trip_id, event_type, data):
+        """Send an event to every subscriber of a trip, in all workers.
+
+        Runs after the change is committed, so failures are logged rather
+        than raised: a broken relay must not turn a saved change into a 500.
+        """
+        if not self.is_listening(trip_id):
+            self.skip(trip_id)
+            return
+        body = format_event(event_type, data)
+        event_id = None
+        if self.relay is not None:
+            try:
+                event_id = str(self.relay.write(trip_id, body))
+            except sqlite3.Error:
+                logger.exception('Event relay write failed; delivering to this worker only')
+        if event_id is None:
+            event_id = self._local_event_id()
+        self.deliver(trip_id, event_id, frame(event_id, body))
+
+    def skip(self, trip_id):
+        """Record an event that nobody was listening for, without building it.
+
+        A client that reconnects with an older Last-Event-ID then resyncs
+        instead of replaying past the gap. Only needed by the memory backend;
+        with the relay every event is published.
+        """
+        if self.relay is not None:
+            return
+        event_id = self._local_event_id()
+        with self._lock:
+            self._remember(trip_id, event_id, None)
+
+    def _local_event_id(self):
+        # Prefixed with the pid: a reconnect landing on another worker cannot
+        # mistake this worker's ids for its own
+        with self._lock:
+            self._counter += 1
+            return f'{os.getpid()}-{self._counter}'
+
+    def deliver(self, trip_id, event_id, message):
+        """Fan a framed message out to this process's subscribers"""
+        with self._lock:
+            if self.relay is None:
+                self._remember(trip_id, event_id, message)
+            subscribers = list(self._subscribers.get(trip_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event_id, message))
+            except queue.Full:
+                # Slow client: drop its backlog and ask it to reload
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait((None, RESYNC_MESSAGE))
+
+    def _remember(self, trip_id, event_id, message):
+        # Caller holds self._lock
+        now = time.monotonic()
+        self._recent.setdefault(trip_id, deque()).append((now, event_id, message))
+        cutoff = now - EVENT_RETENTION_SECONDS
+        for tid in list(self._recent):
+            recent = self._recent[tid]
+            while recent and recent[0][0] < cutoff:
+                _, old_id, _ = recent.popleft()
+                self._pruned_up_to = max(self._pruned_up_to, int(old_id.split('-')[1]))
+            if not recent:
+                del self._recent[tid]
+
+    def replay(self, trip_id, last_event_id):
+        """Frames published after ``last_event_id``, or None if any were lost"""
+        if self.relay is not None:
+            try:
+                return self.relay.since(trip_id, int(last_event_id))
+            except (ValueError, sqlite3.Error):
+                return None
+
+        pid, _, number = last_event_id.partition('-')
+        if pid != str(os.getpid()) or not number.isdigit():
+            return None
+        number = int(number)
+        with self._lock:
+            if number < self._pruned_up_to:
+                return None
+            recent = list(self._recent.get(trip_id, ()))
+        missed = [(event_id, message) for _, event_id, message in recent
+                  if int(event_id.split('-')[1]) > number]
+        if any(message is None for _, message in missed):
+            return None
+        return missed
+
+    def stream(self, trip_id, last_event_id=None):
+        """Streaming SSE response for one trip"""
+
+        def generate():
+            # Subscribe inside the generator: if the body is never iterated
+            # (HEAD, early abort) no subscriber is left registered
+            subscriber = self.subscribe(trip_id)
+            try:
+                yield 'retry: 3000\n\n'
+                replayed = set()
+                if last_event_id:
+                    missed = self.replay(trip_id, last_event_id)
+                    if missed is None:
+                        yield RESYNC_MESSAGE
+                    else:
+                        for event_id, message in missed:
+                            replayed.add(event_id)
+                            yield message
+                while True:
+                    try:
+                        event_id, message = subscriber.get(timeout=HEARTBEAT_SECONDS)
+                    except queue.Empty:
+                        yield ': keep-alive\n\n'
+                        continue
+                    if event_id not in replayed:
+                        yield message
+            finally:
+                self.unsubscribe(trip_id, subscriber)
+
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # disable proxy buffering (nginx)
+        })
+
+
+broker = Broker()
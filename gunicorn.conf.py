@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for Mantra WebLogix
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+
+# In-process backends only see one worker: live updates would miss viewers
+# on other workers and rate limits would multiply by the worker count.
+# Set before preload_app builds the app; a value already in the environment wins.
+if workers > 1:
+    os.environ.setdefault('EVENTS_BACKEND', 'sqlite')
+    os.environ.setdefault('RATELIMIT_BACKEND', 'sqlite')
+
+# Load the app once in the master and fork workers from it
+preload_app = True
+
+# Live trip updates (SSE) hold connections open, so use cooperative gevent
+# workers when available instead of pinning one sync worker per stream
+try:
+    from gevent import monkey
+except ImportError:
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS', 8))
+else:
+    # Patch before preload_app imports the app, not later in each worker
+    monkey.patch_all()
+    worker_class = 'gevent'
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+
+def post_fork(server, worker):
+    """Give each worker its own database connections after fork"""
+    from wsgi import app
+    from app import dispose_engines
+    dispose_engines(app)
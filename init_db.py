@@ -4,18 +4,31 @@ Database initialization script for Mantra WebLogix
 Run this script to initialize or reset the database
 """
 
-from app import app, db, Trip, Expense
+from app import create_app, init_schema
+from models import db, Trip, Expense, TripSummary, DailyRollup
+from tcs import refresh_trip_summary, rebuild_trip_summaries
+from analytics import refresh_trip_rollups, rebuild_rollups
 import os
 
+app = create_app()
+
 
 def init_db():
     """Initialize the database"""
     with app.app_context():
         # Create all tables
         print("Creating database tables...")
-        db.create_all()
+        init_schema(app)
         print("✅ Database tables created successfully!")
         
+        # Backfill the trip summary table for databases created before it existed
+        if TripSummary.query.count() != Trip.query.count():
+            rebuild_summary()
+        
+        # Backfill analytics rollups for databases created before they existed
+        if Expense.query.first() and not DailyRollup.query.first():
+            rebuild_analytics()
+        
         # Check if database file exists
         db_path = 'weblogix.db'
         if os.path.exists(db_path):
@@ -93,6 +106,9 @@ def add_sample_data():
         
         # Update trip total
         trip.total_amount = sum(exp.amount for exp in expenses)
+        db.session.flush()
+        refresh_trip_summary(trip)
+        refresh_trip_rollups(trip)
         
         db.session.commit()
         
@@ -102,6 +118,22 @@ def add_sample_data():
         print(f"   - Total Amount: ${trip.total_amount:.2f}")
 
 
+def rebuild_summary():
+    """Rebuild the materialized trip summary table"""
+    with app.app_context():
+        print("Rebuilding trip summary table...")
+        count = rebuild_trip_summaries()
+        print(f"✅ Trip summary rebuilt ({count} trips)")
+
+
+def rebuild_analytics():
+    """Rebuild the daily and per-member analytics rollups"""
+    with app.app_context():
+        print("Rebuilding analytics rollups...")
+        count = rebuild_rollups()
+        print(f"✅ Analytics rollups rebuilt ({count} expenses)")
+
+
 def show_stats():
     """Display database statistics"""
     with app.app_context():
@@ -134,6 +166,10 @@ if __name__ == '__main__':
         elif command == 'sample':
             init_db()
             add_sample_data()
+        elif command == 'rebuild-summary':
+            rebuild_summary()
+        elif command == 'rebuild-analytics':
+            rebuild_analytics()
         elif command == 'stats':
             show_stats()
         else:
@@ -142,6 +178,8 @@ if __name__ == '__main__':
             print("  init    - Initialize the database")
             print("  reset   - Reset the database (delete all data)")
             print("  sample  - Initialize and add sample data")
+            print("  rebuild-summary - Rebuild the trip summary table")
+            print("  rebuild-analytics - Rebuild the analytics rollup tables")
             print("  stats   - Show database statistics")
     else:
         # Default: initialize
@@ -11,7 +11,7 @@ db = SQLAlchemy()
 class Trip(db.Model):
     """Trip model for storing trip information"""
     
-    __tablename__ = 'trips'
+    __tablename__ = 'trip'
     
     id = db.Column(db.String(50), primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -42,15 +42,21 @@ class Trip(db.Model):
 class Expense(db.Model):
     """Expense model for storing expense information"""
     
-    __tablename__ = 'expenses'
+    __tablename__ = 'expense'
+    __table_args__ = (
+        # Loading one trip's expenses, and its date-range analytics
+        db.Index('ix_expense_trip_id_date', 'trip_id', 'date'),
+        # Per-member date-range analytics
+        db.Index('ix_expense_paid_by_date', 'paid_by', 'date'),
+    )
     
     id = db.Column(db.String(50), primary_key=True)
-    trip_id = db.Column(db.String(50), db.ForeignKey('trips.id'), nullable=False)
+    trip_id = db.Column(db.String(50), db.ForeignKey('trip.id'), nullable=False)
     description = db.Column(db.String(200), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     paid_by = db.Column(db.String(100), nullable=False)
     split_among = db.Column(db.JSON, default=[])  # Store as JSON array
-    date = db.Column(db.DateTime, default=datetime.now)
+    date = db.Column(db.DateTime, default=datetime.now, index=True)
     
     def __repr__(self):
         return f'<Expense {self.id}: {self.description}>'
@@ -65,3 +71,74 @@ class Expense(db.Model):
             'split_among': self.split_among,
             'date': self.date.isoformat()
         }
+
+
+class TripSummary(db.Model):
+    """Materialized per-trip summary backing the /tcs/summary page"""
+    
+    __tablename__ = 'trip_summary'
+    __table_args__ = (
+        # Keyset pagination order: newest activity first, trip id as tie-breaker
+        db.Index('ix_trip_summary_activity', 'last_activity', 'trip_id'),
+    )
+    
+    trip_id = db.Column(db.String(50), db.ForeignKey('trip.id'), primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    created_date = db.Column(db.DateTime, nullable=False)
+    members_count = db.Column(db.Integer, default=0)
+    total_amount = db.Column(db.Float, default=0.0)
+    expenses_count = db.Column(db.Integer, default=0)
+    last_activity = db.Column(db.DateTime, nullable=False)
+    settlements = db.Column(db.JSON, default=[])  # Store as JSON array
+    
+    def __repr__(self):
+        return f'<TripSummary {self.trip_id}: {self.name}>'
+    
+    def to_dict(self):
+        """Convert summary row to the dictionary shape used by summary.html"""
+        return {
+            'id': self.trip_id,
+            'name': self.name,
+            'members_count': self.members_count,
+            'total_amount': self.total_amount,
+            'expenses_count': self.expenses_count,
+            'date_created': self.created_date.isoformat(),
+            'last_activity': self.last_activity.isoformat(),
+            'settlements': self.settlements
+        }
+
+
+class DailyRollup(db.Model):
+    """Per-trip, per-day expense totals maintained on write"""
+    
+    __tablename__ = 'daily_rollup'
+    __table_args__ = (
+        db.Index('ix_daily_rollup_day', 'day'),
+    )
+    
+    trip_id = db.Column(db.String(50), db.ForeignKey('trip.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    total_amount = db.Column(db.Float, default=0.0)
+    expenses_count = db.Column(db.Integer, default=0)
+    
+    def __repr__(self):
+        return f'<DailyRollup {self.trip_id} {self.day}>'
+
+
+class MemberDailyRollup(db.Model):
+    """Per-member, per-trip, per-day paid amount and share maintained on write"""
+    
+    __tablename__ = 'member_daily_rollup'
+    __table_args__ = (
+        db.Index('ix_member_daily_rollup_member_day', 'member', 'day'),
+    )
+    
+    trip_id = db.Column(db.String(50), db.ForeignKey('trip.id'), primary_key=True)
+    member = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    paid = db.Column(db.Float, default=0.0)  # Amount this member paid
+    share = db.Column(db.Float, default=0.0)  # This member's part of the split
+    expenses_count = db.Column(db.Integer, default=0)  # Expenses paid by this member
+    
+    def __repr__(self):
+        return f'<MemberDailyRollup {self.trip_id} {self.member} {self.day}>'
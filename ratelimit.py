@@ -0,0 +1,253 @@
+"""
+Rate limiting and admission control for Mantra WebLogix TCS
+Token buckets keyed per client IP, session and trip, and concurrency caps for
+expensive endpoints. Over-limit requests get 429 with Retry-After.
+"""
+
+from flask import current_app, request, session, jsonify, render_template
+from functools import wraps
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Buckets idle this long are full again and can be forgotten
+IDLE_BUCKET_SECONDS = 3600
+
+# Prune idle buckets every this many calls
+PRUNE_EVERY = 1000
+
+# Per-IP buckets are this many times a session's rate and burst, so several
+# users behind one NAT are not throttled as one client
+IP_BUCKET_FACTOR = 4
+
+logger = logging.getLogger(__name__)
+
+
+def _take_token(tokens, updated, now, rate, burst):
+    """Refill a bucket and try to take one token.
+
+    Returns (allowed, tokens_left, retry_after_seconds).
+    """
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+
+# ==================== BUCKET BACKENDS ====================
+
+class MemoryBackend:
+    """Token buckets held in this process (one set per gunicorn worker)"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            allowed, tokens, retry_after = _take_token(tokens, updated, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+
+            self._calls += 1
+            if self._calls % PRUNE_EVERY == 0:
+                cutoff = now - IDLE_BUCKET_SECONDS
+                self._buckets = {k: v for k, v in self._buckets.items() if v[1] >= cutoff}
+        return allowed, retry_after
+
+    def store(self, key, tokens):
+        """Set a bucket's level (used to mirror a shared store)"""
+        with self._lock:
+            self._buckets[key] = (tokens, time.monotonic())
+
+
+class SQLiteBackend:
+    """Token buckets in a local SQLite file, shared by all workers on a host.
+
+    Each process uses one connection, serialized by a lock: with gevent
+    workers a thread-local connection would be per greenlet and reopened on
+    every request. The connection never waits for another worker's lock
+    (SQLite's busy wait would block the whole gevent worker); a locked or
+    broken store falls back to this process's in-memory buckets instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._fallback = MemoryBackend()
+        self._calls = 0
+
+    def _connection(self):
+        # Opened lazily, and again after a fork, so it is never shared by workers
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def take(self, key, rate, burst):
+        """Take a token, from the in-memory buckets if the store is unavailable.
+
+        Lock contention is most likely during the abuse this guards against,
+        so the request is still limited (per worker) rather than allowed.
+        """
+        try:
+            with self._lock:
+                allowed, tokens, retry_after = self._take(key, rate, burst)
+        except sqlite3.Error as error:
+            # Another worker holding the lock is routine; anything else is not
+            level = logging.DEBUG if 'locked' in str(error) else logging.WARNING
+            logger.log(level, 'Rate limit store unavailable, using memory buckets: %s', error)
+            return self._fallback.take(key, rate, burst)
+        # Keep the fallback at the last known level, so falling back does not
+        # hand a drained client a fresh burst
+        self._fallback.store(key, tokens)
+        return allowed, retry_after
+
+    def _take(self, key, rate, burst):
+        # Caller holds self._lock
+        conn = self._connection()
+        now = time.time()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            allowed, tokens, retry_after = _take_token(tokens, updated, now, rate, burst)
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+
+            self._calls += 1
+            if self._calls % PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - IDLE_BUCKET_SECONDS,))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        return allowed, tokens, retry_after
+
+
+class RateLimiter:
+    """Flask extension holding the bucket backend and concurrency slots"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self._slots = {}
+        self._slots_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_BACKEND', 'memory')
+        app.config.setdefault('RATELIMIT_SQLITE_PATH', 'ratelimit.db')
+
+        if app.config['RATELIMIT_BACKEND'] == 'sqlite':
+            self.backend = SQLiteBackend(app.config['RATELIMIT_SQLITE_PATH'])
+        else:
+            self.backend = MemoryBackend()
+        app.extensions['ratelimit'] = self
+
+    def slot(self, name, limit):
+        """Semaphore limiting concurrent requests to one endpoint (per worker)"""
+        with self._slots_lock:
+            if name not in self._slots:
+                self._slots[name] = threading.BoundedSemaphore(limit)
+            return self._slots[name]
+
+
+limiter = RateLimiter()
+
+
+# ==================== HELPER FUNCTIONS ====================
+
+def client_key():
+    """Rate limit key for this client's session bucket.
+
+    Requests without a session cookie are keyed on the client IP, so a
+    client that drops cookies does not get a fresh bucket every time.
+    """
+    if 'client_id' not in session:
+        session['client_id'] = uuid.uuid4().hex
+        return f'ip:{request.remote_addr}'
+    return f"id:{session['client_id']}"
+
+
+def too_many_requests(retry_after):
+    """429 response with Retry-After, as JSON or HTML to match the caller"""
+    retry_after = max(1, math.ceil(retry_after))
+    headers = {'Retry-After': str(retry_after)}
+    if request.is_json or not request.accept_mimetypes.accept_html:
+        response = jsonify({'status': 'error', 'message': 'Too many requests', 'retry_after': retry_after})
+        return response, 429, headers
+    return render_template('429.html', retry_after=retry_after), 429, headers
+
+
+# ==================== DECORATORS ====================
+
+def rate_limited(session_rate, session_burst, trip_rate=None, trip_burst=None):
+    """Token-bucket limit a view per client IP, per session and optionally per trip.
+
+    Rates are tokens per second; bursts are bucket sizes. The IP bucket is
+    IP_BUCKET_FACTOR times the session bucket. The trip bucket is keyed on
+    the ``trip_id`` URL argument and shared by all sessions.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            ext = current_app.extensions['ratelimit']
+            if not current_app.config['RATELIMIT_ENABLED']:
+                return view(*args, **kwargs)
+
+            allowed, retry_after = ext.backend.take(
+                f'ip:{request.endpoint}:{request.remote_addr}',
+                session_rate * IP_BUCKET_FACTOR, session_burst * IP_BUCKET_FACTOR)
+            if not allowed:
+                return too_many_requests(retry_after)
+
+            allowed, retry_after = ext.backend.take(
+                f'session:{request.endpoint}:{client_key()}', session_rate, session_burst)
+            if not allowed:
+                return too_many_requests(retry_after)
+
+            trip_id = kwargs.get('trip_id')
+            if trip_rate and trip_id:
+                allowed, retry_after = ext.backend.take(
+                    f'trip:{request.endpoint}:{trip_id}', trip_rate, trip_burst)
+                if not allowed:
+                    return too_many_requests(retry_after)
+
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def concurrency_limited(limit, retry_after=1):
+    """Reject a request with 429 when ``limit`` copies of the view already run"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            ext = current_app.extensions['ratelimit']
+            if not current_app.config['RATELIMIT_ENABLED']:
+                return view(*args, **kwargs)
+
+            slot = ext.slot(request.endpoint, limit)
+            if not slot.acquire(blocking=False):
+                return too_many_requests(retry_after)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                slot.release()
+        return wrapper
+    return decorator
@@ -0,0 +1,569 @@
+"""
+TCS (TripContriSplitter) blueprint for Mantra WebLogix
+"""
+
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for
+from datetime import datetime
+
+from models import db, Trip, Expense, TripSummary
+from analytics import apply_expense_rollup, clear_trip_rollups, refresh_trip_rollups
+from ratelimit import rate_limited, concurrency_limited
+from events import broker
+
+tcs_bp = Blueprint('tcs', __name__)
+
+# Trips per page on /tcs/summary
+SUMMARY_PAGE_SIZE = 20
+
+# Token buckets (tokens/second, burst) for mutating trip endpoints. The trip
+# bucket is larger than one IP's allowance (IP_BUCKET_FACTOR x session), so
+# a single client cannot drain it and lock out the trip's other members.
+MUTATION_LIMITS = dict(session_rate=2, session_burst=10, trip_rate=12, trip_burst=60)
+# Entering a trip id is also a guessing surface, so it is slower. No trip
+# bucket: guesses are spread over trip ids, and a shared one would let a
+# single client keep members out of their own trip.
+ENTER_LIMITS = dict(session_rate=0.5, session_burst=5)
+
+# ==================== TCS (TripContriSplitter) ROUTES ====================
+
+@tcs_bp.route('/tcs')
+def tcs_dashboard():
+    """TCS Dashboard - Main page"""
+    return render_template('tcs/dashboard.html')
+
+@tcs_bp.route('/tcs/admin/login', methods=['GET', 'POST'])
+def tcs_admin_login():
+    """Admin Login - Authenticate with passkey"""
+    if request.method == 'POST':
+        data = request.get_json()
+        passkey = data.get('passkey', '')
+        if passkey == 'weblogix2014':
+            session['admin_authenticated'] = True
+            return jsonify({'status': 'success', 'message': 'Authentication successful'})
+        else:
+            return jsonify({'status': 'error', 'message': 'Invalid passkey'})
+    return render_template('tcs/admin_login.html')
+
+@tcs_bp.route('/tcs/admin/logout')
+def tcs_admin_logout():
+    """Admin Logout - Clear admin session"""
+    session.pop('admin_authenticated', None)
+    return redirect(url_for('.tcs_dashboard'))
+
+@tcs_bp.route('/tcs/admin')
+@concurrency_limited(2)
+def tcs_admin_dashboard():
+    """Admin Dashboard - View and manage all trips"""
+    # Check if user is authenticated as admin
+    if not session.get('admin_authenticated'):
+        return redirect(url_for('.tcs_admin_login'))
+    
+    trips = Trip.query.all()
+    trips_data = []
+    for trip in trips:
+        trip_dict = trip.to_dict()
+        settlements = calculate_settlements(trip_dict)
+        trips_data.append({
+            'id': trip.id,
+            'name': trip.name,
+            'description': trip.description,
+            'created_date': trip.created_date.isoformat(),
+            'members_count': len(trip.members),
+            'expenses_count': len(trip.expenses),
+            'total_amount': trip.total_amount,
+            'settlements': settlements
+        })
+    return render_template('tcs/admin_dashboard.html', trips=trips_data)
+
+@tcs_bp.route('/tcs/trip/new', methods=['GET', 'POST'])
+def tcs_create_trip():
+    """Create a new trip"""
+    if request.method == 'POST':
+        data = request.get_json()
+        trip_id = f"trip_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # Create new trip in database
+        trip = Trip(
+            id=trip_id,
+            name=data['name'],
+            description=data.get('description', ''),
+            members=data.get('members', []),
+            total_amount=0
+        )
+        
+        db.session.add(trip)
+        db.session.flush()  # apply column defaults (created_date)
+        refresh_trip_summary(trip)
+        db.session.commit()
+        
+        # Add trip to this session's authorized trips so creator can manage it immediately
+        authorized = session.get('authorized_trips', [])
+        if trip_id not in authorized:
+            authorized.append(trip_id)
+            session['authorized_trips'] = authorized
+
+        # Return trip id and authorize URL
+        return jsonify({'status': 'success', 'trip_id': trip_id, 'authorize_url': f'/tcs/trip/{trip_id}/auth'})
+    
+    return render_template('tcs/create_trip.html')
+
+@tcs_bp.route('/tcs/trip/<trip_id>')
+def tcs_trip_details(trip_id):
+    """View trip details and settlement"""
+    trip = Trip.query.get(trip_id)
+    
+    if not trip:
+        return render_template('tcs/error.html', message='Trip not found'), 404
+    # Use session-based authorization: require user to 'enter' the trip id once
+    authorized = session.get('authorized_trips', [])
+    is_authorized = trip_id in authorized
+
+    if not is_authorized:
+        # render a small authorization prompt where the user must enter the trip id
+        return render_template('tcs/authorize.html', trip_id=trip_id)
+
+    trip_dict = trip.to_dict()
+    settlements = calculate_settlements(trip_dict)
+
+    # Calculate member balances
+    member_balances = calculate_member_balances(trip_dict)
+
+    return render_template('tcs/trip_details.html', trip=trip_dict, settlements=settlements, member_balances=member_balances, is_owner=True)
+
+@tcs_bp.route('/tcs/trip/<trip_id>/add-expense', methods=['POST'])
+@rate_limited(**MUTATION_LIMITS)
+def tcs_add_expense(trip_id):
+    """Add expense to a trip"""
+    trip = Trip.query.get(trip_id)
+    
+    if not trip:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    
+    # Session-based authorization: ensure the user has entered trip id previously
+    authorized = session.get('authorized_trips', [])
+    if trip_id not in authorized:
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    
+    data = request.get_json()
+    
+    # Create new expense
+    expense_id = f"exp_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    expense = Expense(
+        id=expense_id,
+        trip_id=trip_id,
+        description=data['description'],
+        amount=float(data['amount']),
+        paid_by=data['paid_by'],
+        split_among=data['split_among']
+    )
+    
+    db.session.add(expense)
+    db.session.flush()  # flush to ensure expense is in trip.expenses
+    
+    # Update trip total amount by summing all expenses
+    trip.total_amount = sum([exp.amount for exp in trip.expenses])
+    trip_dict = trip.to_dict()
+    summary = refresh_trip_summary(trip, trip_dict)
+    apply_expense_rollup(expense, trip.members)
+    expense_dict = expense.to_dict()
+    
+    db.session.commit()
+    publish_trip_event(trip_dict, summary, 'expense_added', expense=expense_dict)
+    
+    return jsonify({'status': 'success', 'expense': expense_dict})
+
+@tcs_bp.route('/tcs/trip/<trip_id>/settlements', methods=['GET'])
+@concurrency_limited(4)
+def tcs_get_settlements(trip_id):
+    """Get settlement details for a trip"""
+    trip = Trip.query.get(trip_id)
+    
+    if not trip:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    # Session-based check: ensure trip was authorized in session
+    authorized = session.get('authorized_trips', [])
+    if trip_id not in authorized:
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+
+    trip_dict = trip.to_dict()
+    settlements = calculate_settlements(trip_dict)
+
+    return jsonify({
+        'status': 'success',
+        'settlements': settlements,
+        'total': trip.total_amount
+    })
+
+@tcs_bp.route('/tcs/trip/<trip_id>/events')
+def tcs_trip_events(trip_id):
+    """Server-Sent Events stream of live changes to a trip"""
+    trip = Trip.query.get(trip_id)
+    
+    if not trip:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    authorized = session.get('authorized_trips', [])
+    if trip_id not in authorized:
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+
+    # EventSource sends Last-Event-ID on reconnect so missed events can be replayed
+    return broker.stream(trip_id, request.headers.get('Last-Event-ID'))
+
+@tcs_bp.route('/tcs/summary')
+@concurrency_limited(4)
+def tcs_summary():
+    """View all trips summary, one page at a time (newest activity first)"""
+    cursor = request.args.get('after')
+    try:
+        rows, next_cursor = summary_page(cursor)
+    except ValueError:
+        return redirect(url_for('.tcs_summary'))
+    summary = [row.to_dict() for row in rows]
+    
+    return render_template('tcs/summary.html', summary=summary, next_cursor=next_cursor, is_first_page=not cursor)
+
+
+# ==================== AUTHORIZATION ROUTES ====================
+@tcs_bp.route('/tcs/trip/<trip_id>/auth')
+def tcs_show_authorize(trip_id):
+    """Show authorization prompt with trip ID visible"""
+    trip = Trip.query.get(trip_id)
+    if not trip:
+        return render_template('tcs/error.html', message='Trip not found'), 404
+    return render_template('tcs/authorize.html', trip_id=trip_id)
+
+@tcs_bp.route('/tcs/trip/<trip_id>/enter', methods=['POST'])
+@rate_limited(**ENTER_LIMITS)
+def tcs_enter_trip(trip_id):
+    """User submits trip id to gain access for viewing/editing in this session"""
+    trip = Trip.query.get(trip_id)
+    if not trip:
+        return render_template('tcs/error.html', message='Trip not found'), 404
+
+    entered = request.form.get('entered_id') or (request.get_json(silent=True) and request.get_json().get('entered_id'))
+    if not entered:
+        return render_template('tcs/authorize.html', trip_id=trip_id, error='Please enter the trip id')
+
+    # simple compare: if entered matches the trip id, authorize in session
+    if str(entered).strip() == str(trip_id):
+        authorized = session.get('authorized_trips', [])
+        if trip_id not in authorized:
+            authorized.append(trip_id)
+            session['authorized_trips'] = authorized
+        trip_dict = trip.to_dict()
+        return render_template('tcs/trip_details.html', trip=trip_dict, settlements=calculate_settlements(trip_dict), member_balances=calculate_member_balances(trip_dict), is_owner=True)
+
+    return render_template('tcs/authorize.html', trip_id=trip_id, error='Invalid trip id')
+
+
+# ==================== MEMBER / EXPENSE / TRIP MANAGEMENT ====================
+@tcs_bp.route('/tcs/trip/<trip_id>/add-member', methods=['POST'])
+@rate_limited(**MUTATION_LIMITS)
+def tcs_add_member(trip_id):
+    trip = Trip.query.get(trip_id)
+    if not trip:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    authorized = session.get('authorized_trips', [])
+    if trip_id not in authorized:
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+
+    data = request.get_json()
+    name = data.get('name') if data else None
+    if not name:
+        return jsonify({'status': 'error', 'message': 'Name required'}), 400
+
+    members = list(trip.members or [])  # copy so the JSON column sees the change
+    if name in members:
+        return jsonify({'status': 'error', 'message': 'Member already exists'}), 400
+
+    members.append(name)
+    trip.members = members
+    trip_dict = trip.to_dict()
+    summary = refresh_trip_summary(trip, trip_dict)
+    refresh_trip_rollups(trip)  # even splits now include the new member
+    db.session.commit()
+    publish_trip_event(trip_dict, summary, 'members_changed')
+    return jsonify({'status': 'success', 'members': members})
+
+
+@tcs_bp.route('/tcs/trip/<trip_id>/delete-member', methods=['POST'])
+@rate_limited(**MUTATION_LIMITS)
+def tcs_delete_member(trip_id):
+    trip = Trip.query.get(trip_id)
+    if not trip:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    authorized = session.get('authorized_trips', [])
+    if trip_id not in authorized:
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+
+    data = request.get_json()
+    name = data.get('name') if data else None
+    if not name:
+        return jsonify({'status': 'error', 'message': 'Name required'}), 400
+
+    members = list(trip.members or [])  # copy so the JSON column sees the change
+    if name not in members:
+        return jsonify({'status': 'error', 'message': 'Member not found'}), 404
+
+    # Remove from members
+    members.remove(name)
+    trip.members = members
+
+    # Remove member from expense splits and delete expenses they paid
+    removed_ids = []
+    for exp in list(trip.expenses):
+        changed = False
+        if name == exp.paid_by:
+            # delete expense entirely (delete-orphan cascade removes the row)
+            trip.expenses.remove(exp)
+            removed_ids.append(exp.id)
+            changed = True
+        else:
+            splits = exp.split_among or []
+            if name in splits:
+                splits = [s for s in splits if s != name]
+                exp.split_among = splits
+                changed = True
+        if changed:
+            pass
+
+    # Recompute total amount
+    trip.total_amount = sum([e.amount for e in trip.expenses])
+    trip_dict = trip.to_dict()
+    summary = refresh_trip_summary(trip, trip_dict)
+    refresh_trip_rollups(trip)
+    db.session.commit()
+    publish_trip_event(trip_dict, summary, 'members_changed', expense_ids=removed_ids)
+    return jsonify({'status': 'success', 'members': members})
+
+
+@tcs_bp.route('/tcs/trip/<trip_id>/delete-expense', methods=['POST'])
+@rate_limited(**MUTATION_LIMITS)
+def tcs_delete_expense(trip_id):
+    trip = Trip.query.get(trip_id)
+    if not trip:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    authorized = session.get('authorized_trips', [])
+    if trip_id not in authorized:
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+
+    data = request.get_json()
+    exp_id = data.get('expense_id') if data else None
+    if not exp_id:
+        return jsonify({'status': 'error', 'message': 'expense_id required'}), 400
+
+    exp = Expense.query.get(exp_id)
+    if not exp or exp.trip_id != trip_id:
+        return jsonify({'status': 'error', 'message': 'Expense not found'}), 404
+
+    apply_expense_rollup(exp, trip.members, sign=-1)
+    db.session.delete(exp)
+    db.session.commit()
+    # Update total
+    trip = Trip.query.get(trip_id)
+    trip.total_amount = sum([e.amount for e in trip.expenses])
+    trip_dict = trip.to_dict()
+    summary = refresh_trip_summary(trip, trip_dict)
+    db.session.commit()
+    publish_trip_event(trip_dict, summary, 'expense_removed', expense_id=exp_id)
+    return jsonify({'status': 'success'})
+
+
+@tcs_bp.route('/tcs/trip/<trip_id>/delete', methods=['POST'])
+@rate_limited(**MUTATION_LIMITS)
+def tcs_delete_trip(trip_id):
+    trip = Trip.query.get(trip_id)
+    if not trip:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    authorized = session.get('authorized_trips', [])
+    if trip_id not in authorized:
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+
+    TripSummary.query.filter_by(trip_id=trip_id).delete()
+    clear_trip_rollups(trip_id)
+    db.session.delete(trip)
+    db.session.commit()
+    broker.publish(trip_id, 'trip_deleted', {'trip_id': trip_id})
+    # remove from session
+    authorized = session.get('authorized_trips', [])
+    if trip_id in authorized:
+        authorized.remove(trip_id)
+        session['authorized_trips'] = authorized
+    return jsonify({'status': 'success'})
+
+# ==================== HELPER FUNCTIONS ====================
+
+def calculate_member_balances(trip):
+    """Calculate balance for each member"""
+    balances = {}
+    for member in trip.get('members', []):
+        balances[member] = 0
+    
+    # Process each expense
+    for expense in trip['expenses']:
+        paid_by = expense['paid_by']
+        amount = expense['amount']
+        split_among = expense['split_among']
+        
+        if not split_among:
+            split_among = trip.get('members', [])
+        
+        split_amount = amount / len(split_among) if split_among else 0
+        
+        # Add to payer's balance (they paid more)
+        balances[paid_by] = balances.get(paid_by, 0) + amount
+        
+        # Subtract from everyone's balance
+        for person in split_among:
+            balances[person] = balances.get(person, 0) - split_amount
+    
+    return balances
+
+def calculate_settlements(trip):
+    """Calculate who owes whom and how much"""
+    if not trip['expenses']:
+        return []
+    
+    # Calculate each person's balance
+    balances = {}
+    for member in trip.get('members', []):
+        balances[member] = 0
+    
+    # Process each expense
+    for expense in trip['expenses']:
+        paid_by = expense['paid_by']
+        amount = expense['amount']
+        split_among = expense['split_among']
+        
+        if not split_among:
+            split_among = trip.get('members', [])
+        
+        split_amount = amount / len(split_among) if split_among else 0
+        
+        # Add to payer's balance (they paid more)
+        balances[paid_by] = balances.get(paid_by, 0) + amount
+        
+        # Subtract from everyone's balance
+        for person in split_among:
+            balances[person] = balances.get(person, 0) - split_amount
+    
+    # Generate settlement list (who owes/receives what)
+    settlements = []
+    
+    # Separate debtors and creditors
+    debtors = [(person, amount) for person, amount in balances.items() if amount < 0]
+    creditors = [(person, amount) for person, amount in balances.items() if amount > 0]
+    
+    debtors.sort(key=lambda x: x[1])  # Most negative first
+    creditors.sort(key=lambda x: x[1], reverse=True)  # Most positive first
+    
+    # Match debtors with creditors
+    for debtor, debt in debtors:
+        debt = abs(debt)
+        for i, (creditor, credit) in enumerate(creditors):
+            if credit <= 0:
+                continue
+            
+            settlement_amount = min(debt, credit)
+            settlements.append({
+                'from': debtor,
+                'to': creditor,
+                'amount': round(settlement_amount, 2),
+                'status': 'pending'
+            })
+            
+            debt -= settlement_amount
+            creditors[i] = (creditor, credit - settlement_amount)
+            
+            if debt == 0:
+                break
+    
+    return settlements
+
+def publish_trip_event(trip_dict, summary, event_type, **data):
+    """Publish a compact change event with the trip's updated balances.
+
+    Reuses the trip dict and summary row built earlier in the same request;
+    balances are only computed when someone can receive the event.
+    """
+    trip_id = trip_dict['id']
+    if not broker.is_listening(trip_id):
+        broker.skip(trip_id)
+        return
+    data.update({
+        'total': trip_dict['total_amount'],
+        'expenses_count': len(trip_dict['expenses']),
+        'members': trip_dict['members'],
+        'balances': calculate_member_balances(trip_dict),
+        'settlements': summary.settlements
+    })
+    broker.publish(trip_id, event_type, data)
+
+
+# ==================== TRIP SUMMARY (MATERIALIZED) ====================
+
+def refresh_trip_summary(trip, trip_dict=None, last_activity=None):
+    """Recompute the stored summary row for one trip.
+
+    Called by every mutating route before its commit; pass the route's
+    ``trip.to_dict()`` so the trip is serialized once per request. Loading
+    the trip's expenses uses the ``ix_expense_trip_id_date`` index.
+    """
+    trip_dict = trip_dict or trip.to_dict()
+    row = TripSummary.query.get(trip.id)
+    if row is None:
+        row = TripSummary(trip_id=trip.id)
+        db.session.add(row)
+
+    row.name = trip.name
+    row.created_date = trip.created_date
+    row.members_count = len(trip.members or [])
+    row.total_amount = trip.total_amount or 0.0
+    row.expenses_count = len(trip_dict['expenses'])
+    row.last_activity = last_activity or datetime.now()
+    row.settlements = calculate_settlements(trip_dict)
+    return row
+
+
+def rebuild_trip_summaries():
+    """Rebuild the whole trip summary table from trips and expenses"""
+    TripSummary.query.delete()
+    count = 0
+    # Load every trip's expenses in one extra query instead of one per trip
+    for trip in Trip.query.options(db.selectinload(Trip.expenses)):
+        activity = [trip.created_date] + [exp.date for exp in trip.expenses if exp.date]
+        refresh_trip_summary(trip, last_activity=max(activity))
+        count += 1
+    db.session.commit()
+    return count
+
+
+def encode_summary_cursor(row):
+    """Keyset cursor pointing just past the given summary row"""
+    return f"{row.last_activity.isoformat()}|{row.trip_id}"
+
+
+def summary_page(cursor=None, page_size=SUMMARY_PAGE_SIZE):
+    """Return (rows, next_cursor) for one page of the trip summary.
+
+    Uses keyset pagination on (last_activity, trip_id), which is served by
+    the ix_trip_summary_activity index. Raises ValueError on a bad cursor.
+    """
+    query = TripSummary.query
+    if cursor:
+        activity, _, trip_id = cursor.partition('|')
+        activity = datetime.fromisoformat(activity)
+        if not trip_id:
+            raise ValueError('Invalid cursor')
+        query = query.filter(db.or_(
+            TripSummary.last_activity < activity,
+            db.and_(TripSummary.last_activity == activity, TripSummary.trip_id < trip_id)
+        ))
+
+    rows = query.order_by(
+        TripSummary.last_activity.desc(), TripSummary.trip_id.desc()
+    ).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_summary_cursor(rows[-1])
+    return rows, next_cursor